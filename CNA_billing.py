@@ -0,0 +1,226 @@
+# CNA_billing.py
+import os
+import sqlite3
+from datetime import datetime
+import pandas as pd
+from CNA_utils import base_dir
+
+# Colonne attese nella tabella tariffe (CSV ; o ,). "*" in CARRIER/FLT_TYPE/MOD = qualsiasi.
+# MTOW_MIN/MTOW_MAX in tonnellate, estremi inclusi; vuoti = nessun limite.
+TARIFF_COLS = ["CARRIER", "FLT_TYPE", "MOD", "MTOW_MIN", "MTOW_MAX", "HANDLING_FEE", "CURRENCY"]
+
+LEDGER_COLS = ["CARRIER", "ID", "FLT_N", "STD", "ATD", "FLT_TYPE", "MOD", "MTOW",
+               "SURCHARGE", "HANDLING_FEE", "AMOUNT", "CURRENCY", "BILLED_AT", "EXPORT_BATCH"]
+
+
+def load_tariffs(filename: str = "tariffs.csv") -> pd.DataFrame | None:
+    """
+    Legge la tabella tariffe (cartella accanto all'eseguibile o al .py).
+    Restituisce None se il file non esiste.
+    """
+    path = filename if os.path.isabs(filename) else os.path.join(base_dir(), filename)
+    if not os.path.exists(path):
+        return None
+
+    t = pd.read_csv(path, sep=None, dtype=str, engine="python").fillna("")
+    t.columns = [c.strip().upper() for c in t.columns]
+    miss = [c for c in TARIFF_COLS if c not in t.columns]
+    if miss:
+        raise KeyError(f"Colonne mancanti nella tabella tariffe {path}: {miss}")
+
+    for c in ("CARRIER", "FLT_TYPE", "MOD"):
+        t[c] = t[c].str.strip().str.upper().replace("", "*")
+    t["CURRENCY"] = t["CURRENCY"].str.strip().str.upper()
+    no_cur = t["CURRENCY"].eq("")
+    if no_cur.any():
+        print(f"Tariffe senza CURRENCY ignorate (righe {[i + 2 for i in t.index[no_cur]]} di {path}).")
+        t = t[~no_cur]
+    t["MTOW_MIN"] = pd.to_numeric(t["MTOW_MIN"].str.replace(",", "."), errors="coerce").fillna(float("-inf"))
+    t["MTOW_MAX"] = pd.to_numeric(t["MTOW_MAX"].str.replace(",", "."), errors="coerce").fillna(float("inf"))
+    t["HANDLING_FEE"] = pd.to_numeric(t["HANDLING_FEE"].str.replace(",", "."), errors="coerce")
+    return t.loc[t["HANDLING_FEE"].notna(), TARIFF_COLS].reset_index(drop=True)
+
+
+def price_surcharges(turns: pd.DataFrame, tariffs: pd.DataFrame) -> pd.DataFrame:
+    """
+    Associa a ogni turno la tariffa più specifica (CARRIER, FLT_TYPE, MOD esatti prima di "*",
+    MTOW nella fascia) e calcola AMOUNT = HANDLING_FEE × SURCHARGE%. Tutto vettoriale.
+    A parità di specificità (es. fasce MTOW sovrapposte) vale la prima riga della tabella.
+    I turni senza tariffa restano con HANDLING_FEE/AMOUNT vuoti.
+    """
+    t = turns.reset_index(drop=True).copy()
+    t["_ROW"] = t.index
+    mtow = pd.to_numeric(t["MTOW"].astype(str).str.replace(",", "."), errors="coerce")
+
+    cand = t[["_ROW", "CARRIER", "FLT_TYPE", "MOD"]].assign(_MTOW=mtow).merge(
+        tariffs.rename(columns={"CARRIER": "T_CARRIER", "FLT_TYPE": "T_FLT_TYPE", "MOD": "T_MOD"}),
+        how="cross",
+    )
+    ok = (
+        cand["T_CARRIER"].eq("*") | cand["T_CARRIER"].eq(cand["CARRIER"])
+    ) & (
+        cand["T_FLT_TYPE"].eq("*") | cand["T_FLT_TYPE"].eq(cand["FLT_TYPE"])
+    ) & (
+        cand["T_MOD"].eq("*") | cand["T_MOD"].eq(cand["MOD"])
+    ) & (
+        cand["_MTOW"].between(cand["MTOW_MIN"], cand["MTOW_MAX"]) |
+        (cand["_MTOW"].isna() & cand["MTOW_MIN"].eq(float("-inf")) & cand["MTOW_MAX"].eq(float("inf")))
+    )
+    cand = cand[ok].copy()
+    cand["_SPEC"] = (cand["T_CARRIER"].ne("*").astype(int) * 4
+                     + cand["T_FLT_TYPE"].ne("*").astype(int) * 2
+                     + cand["T_MOD"].ne("*").astype(int))
+    best = (
+        cand.sort_values(["_ROW", "_SPEC"], ascending=[True, False], kind="stable")
+        .drop_duplicates(subset=["_ROW"], keep="first")
+        .set_index("_ROW")
+    )
+
+    t["HANDLING_FEE"] = best["HANDLING_FEE"].reindex(t["_ROW"]).to_numpy()
+    t["CURRENCY"] = best["CURRENCY"].reindex(t["_ROW"]).to_numpy()
+    pct = pd.to_numeric(t["SURCHARGE"].astype(str).str.strip().str.rstrip("%"), errors="coerce")
+    t["AMOUNT"] = (t["HANDLING_FEE"] * pct / 100).round(2)
+    return t.drop(columns=["_ROW"])
+
+
+class SurchargeLedger:
+    """
+    Registro append-only (SQLite, cartella accanto all'eseguibile o al .py) degli
+    importi di surcharge. Chiave idempotente (CARRIER, ID): rieseguire lo stesso
+    mese non fattura due volte lo stesso turno.
+
+    Le regole (delta, arkia) aggiungono i propri turni con add(); commit() li prezza
+    tutti insieme e li registra; export_csv() produce il lotto per la fatturazione.
+    """
+
+    def __init__(self, filename: str = "Billing_ledger.sqlite"):
+        self.path = filename if os.path.isabs(filename) else os.path.join(base_dir(), filename)
+        self.pending: list[pd.DataFrame] = []
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ledger ("
+            "CARRIER TEXT NOT NULL, ID TEXT NOT NULL, FLT_N TEXT, STD TEXT, ATD TEXT, "
+            "FLT_TYPE TEXT, MOD TEXT, MTOW TEXT, SURCHARGE TEXT, HANDLING_FEE REAL, "
+            "AMOUNT REAL, CURRENCY TEXT, BILLED_AT TEXT, EXPORT_BATCH TEXT, "
+            "PRIMARY KEY (CARRIER, ID))"
+        )
+        return conn
+
+    def add(self, out: pd.DataFrame, surcharge_col: str = "SURCHARGE"):
+        """Accoda i turni di out con surcharge valorizzato (colonne come in delta/arkia)."""
+        s = out[surcharge_col].fillna("").astype(str).str.strip()
+        sel = out[s.ne("")]
+        if sel.empty:
+            return
+        # FLT_TYPE del turno: FERRY se lo è almeno una tratta (come la regola delta)
+        flt_d = sel["FLT_TYPE_D"].astype(str).str.strip().str.upper()
+        flt_a = (sel["FLT_TYPE_A"].astype(str).str.strip().str.upper()
+                 if "FLT_TYPE_A" in sel.columns else flt_d)
+        flt = flt_d.mask(flt_a.eq("FERRY"), "FERRY")
+        self.pending.append(pd.DataFrame({
+            "CARRIER": sel["IATA"].astype(str).str.strip().str.upper(),
+            "ID": sel["ID"].astype(str).str.strip(),
+            "FLT_N": sel["FLT_N_OUT"].astype(str),
+            "STD": sel["STD"],
+            "ATD": sel["ATD"],
+            "FLT_TYPE": flt,
+            "MOD": sel["MOD"].astype(str).str.strip().str.upper(),
+            "MTOW": sel["MTOW"].astype(str).str.strip(),
+            "SURCHARGE": s[s.ne("")],
+        }))
+
+    def commit(self, tariffs: pd.DataFrame) -> int:
+        """
+        Prezza i turni accodati e li registra (INSERT OR IGNORE). Restituisce i nuovi inseriti.
+        I turni già registrati con SURCHARGE/AMOUNT diversi non vengono aggiornati ma elencati.
+        """
+        if not self.pending:
+            print("Nessun surcharge da fatturare.")
+            return 0
+
+        priced = price_surcharges(pd.concat(self.pending, ignore_index=True), tariffs)
+        self.pending = []
+
+        missing = priced[priced["AMOUNT"].isna()]
+        if not missing.empty:
+            print(f"Turni senza tariffa (non registrati): {missing.shape[0]}")
+            for _, r in missing.iterrows():
+                print(f"  {r['CARRIER']} ID={r['ID']} FLT_TYPE={r['FLT_TYPE']} "
+                      f"MOD={r['MOD']} MTOW={r['MTOW']}")
+
+        rows = priced[priced["AMOUNT"].notna()].copy()
+        for c in ("STD", "ATD"):
+            rows[c] = pd.to_datetime(rows[c], errors="coerce").dt.strftime("%Y-%m-%d %H:%M")
+        rows["BILLED_AT"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows["EXPORT_BATCH"] = None
+        rows = rows.astype(object).where(rows.notna(), None)
+
+        conn = self._connect()
+        try:
+            billed = pd.read_sql_query("SELECT CARRIER, ID, SURCHARGE, AMOUNT FROM ledger", conn)
+            with conn:
+                before = conn.total_changes
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO ledger ({','.join(LEDGER_COLS)}) "
+                    f"VALUES ({','.join('?' * len(LEDGER_COLS))})",
+                    rows[LEDGER_COLS].itertuples(index=False, name=None),
+                )
+                inserted = conn.total_changes - before
+        finally:
+            conn.close()
+
+        print(f"Registro fatturazione: {inserted} nuovi turni, "
+              f"{rows.shape[0] - inserted} già presenti (ignorati).")
+
+        # turni già fatturati con SURCHARGE/AMOUNT diversi: il registro non cambia,
+        # ma vanno elencati perché la rettifica va fatta a mano
+        old = rows.merge(billed, on=["CARRIER", "ID"], suffixes=("", "_OLD"))
+        changed = old[old["SURCHARGE"].ne(old["SURCHARGE_OLD"])
+                      | (pd.to_numeric(old["AMOUNT"]) - old["AMOUNT_OLD"]).abs().gt(0.005)]
+        if not changed.empty:
+            print(f"Turni già fatturati con importo diverso (non aggiornati, da rettificare): "
+                  f"{changed.shape[0]}")
+            for _, r in changed.iterrows():
+                print(f"  {r['CARRIER']} ID={r['ID']} SURCHARGE {r['SURCHARGE_OLD']} -> {r['SURCHARGE']} "
+                      f"AMOUNT {r['AMOUNT_OLD']:.2f} -> {r['AMOUNT']:.2f} {r['CURRENCY']}")
+        return inserted
+
+    def export_csv(self, filename: str | None = None, only_new: bool = True) -> str:
+        """
+        Esporta in CSV (;) le righe del registro per il sistema di fatturazione.
+        Con only_new esporta solo le righe mai esportate e le marca con il lotto corrente;
+        la marcatura è confermata solo se il CSV è stato scritto (altrimenti rollback).
+        """
+        batch = datetime.now().strftime("%Y%m%d_%H%M%S")
+        if filename is None:
+            filename = f"Billing_{batch}.csv"
+
+        out_path = os.path.join(base_dir(), filename)
+        conn = self._connect()
+        try:
+            where = " WHERE EXPORT_BATCH IS NULL" if only_new else ""
+            out = pd.read_sql_query(f"SELECT * FROM ledger{where} ORDER BY CARRIER, STD", conn)
+            if out.empty:
+                print("Nessuna riga da esportare. Nessun file creato.")
+                return ""
+            # marcatura e scrittura nella stessa transazione: se il CSV fallisce, rollback
+            with conn:
+                if only_new:
+                    conn.executemany(
+                        "UPDATE ledger SET EXPORT_BATCH = ? WHERE CARRIER = ? AND ID = ?",
+                        ((batch, c, i) for c, i in zip(out["CARRIER"], out["ID"])),
+                    )
+                    out["EXPORT_BATCH"] = batch
+                try:
+                    out.to_csv(out_path, sep=";", index=False, decimal=",")
+                except Exception:
+                    if os.path.exists(out_path):
+                        os.remove(out_path)
+                    raise
+        finally:
+            conn.close()
+
+        print(f"File CSV creato: {out_path}  (righe: {out.shape[0]})")
+        return out_path
@@ -0,0 +1,116 @@
+# CNA_ontime.py
+import numpy as np
+import pandas as pd
+from CNA_utils import compute_dly_wo_handling, write_excel, HANDLING_CODES
+
+# Partenza puntuale se DLY_REAL ≤ ONTIME_MINUTES (standard D15)
+ONTIME_MINUTES = 15
+WINDOWS = ("1h", "3h", "24h")
+METRICS = ["ONTIME", "DLY_WO_HNDLG", "HNDLG"]
+
+
+def _departures(df: pd.DataFrame, by: str = "STAND") -> pd.DataFrame:
+    """
+    Partenze con STD e ATD validi, ordinate per STD, con le colonne base per le metriche:
+      ONTIME (1/0), DLY_WO_HNDLG (min), HNDLG (1 se DLY_1/DLY_2 ha un codice handling).
+    """
+    dep = df[df["A/D"].astype(str).str.strip().str.upper().eq("D")
+             & df["STD"].notna() & df["ATD"].notna()].copy()
+    dep[by] = dep[by].fillna("").astype(str).str.strip().replace("", "N/D")
+
+    if "DLY_REAL" not in dep.columns or not pd.api.types.is_numeric_dtype(dep["DLY_REAL"]):
+        mins = (dep["ATD"] - dep["STD"]).dt.total_seconds().div(60)
+        dep["DLY_REAL"] = mins.where(mins > 0).round().astype("Int64")
+    dep = compute_dly_wo_handling(dep, "DLY_REAL", "DLY_1", "DLY_1_t", "DLY_2", "DLY_2_t",
+                                  handling_codes=HANDLING_CODES, out_col="DLY_WO_HNDLG")
+
+    d1 = pd.to_numeric(dep["DLY_1"], errors="coerce")
+    d2 = pd.to_numeric(dep["DLY_2"], errors="coerce")
+    dep["ONTIME"] = dep["DLY_REAL"].fillna(0).le(ONTIME_MINUTES).astype(float)
+    dep["HNDLG"] = (d1.isin(HANDLING_CODES) | d2.isin(HANDLING_CODES)).astype(float)
+    dep["DLY_WO_HNDLG"] = dep["DLY_WO_HNDLG"].astype(float)
+    return dep.sort_values("STD", kind="stable").reset_index(drop=True)
+
+
+def ontime_heatmap(df: pd.DataFrame, by: str = "STAND") -> pd.DataFrame:
+    """
+    Tabella "lunga" pronta per heatmap: una riga per (by, DOW, HOUR) di STD, più le righe
+    by="ALL" per l'intero scalo. DOW 1=lunedì … 7=domenica.
+    Colonne: N, ONTIME_PCT, MEAN_DLY_WO_HNDLG, HNDLG_SHARE_PCT.
+    """
+    dep = _departures(df, by)
+    if dep.empty:
+        return pd.DataFrame(columns=[by, "DOW", "HOUR", "N", "ONTIME_PCT",
+                                     "MEAN_DLY_WO_HNDLG", "HNDLG_SHARE_PCT"])
+
+    dep["DOW"] = dep["STD"].dt.dayofweek + 1
+    dep["HOUR"] = dep["STD"].dt.hour
+    all_rows = dep.assign(**{by: "ALL"})
+
+    out = (
+        pd.concat([dep, all_rows], ignore_index=True)
+        .groupby([by, "DOW", "HOUR"], sort=True)
+        .agg(N=("ONTIME", "size"), ONTIME_PCT=("ONTIME", "mean"),
+             MEAN_DLY_WO_HNDLG=("DLY_WO_HNDLG", "mean"), HNDLG_SHARE_PCT=("HNDLG", "mean"))
+        .reset_index()
+    )
+    out["ONTIME_PCT"] = out["ONTIME_PCT"].mul(100).round(1)
+    out["HNDLG_SHARE_PCT"] = out["HNDLG_SHARE_PCT"].mul(100).round(1)
+    out["MEAN_DLY_WO_HNDLG"] = out["MEAN_DLY_WO_HNDLG"].round(1)
+    return out
+
+
+def rolling_ontime(df: pd.DataFrame, by: str = "STAND",
+                   windows: tuple[str, ...] = WINDOWS) -> pd.DataFrame:
+    """
+    Finestre mobili (su indice temporale STD, finestre all'indietro) per ogni partenza:
+    per ciascuna finestra w, N_w / ONTIME_PCT_w / MEAN_DLY_WO_HNDLG_w / HNDLG_SHARE_PCT_w
+    calcolati sulle partenze dello stesso by, più ONTIME_PCT_w_ALL sull'intero scalo.
+    """
+    dep = _departures(df, by)
+    base_cols = ["ID", "IATA", "FLT_N", by, "STD", "ATD", "DLY_REAL", "DLY_WO_HNDLG"]
+    out = dep.loc[:, [c for c in base_cols if c in dep.columns]].copy()
+    if dep.empty:
+        return out
+
+    m = dep.loc[:, ["STD", by] + METRICS]
+    # groupby().rolling(on=STD) restituisce le righe raggruppate per by e non l'indice
+    # originale: si ordina per (by, STD) e si riportano i valori per posizione
+    ms = m.assign(_POS=np.arange(len(m))).sort_values([by, "STD"], kind="stable")
+    pos = ms["_POS"].to_numpy()
+
+    def _back(values) -> np.ndarray:
+        arr = np.empty(len(m), dtype=float)
+        arr[pos] = np.asarray(values, dtype=float)
+        return arr
+
+    for w in windows:
+        r = ms.groupby(by, sort=True).rolling(w, on="STD")
+        mean = r[METRICS].mean()
+        cnt = r["ONTIME"].count()
+        out[f"N_{w}"] = _back(cnt.to_numpy()).astype(int)
+        out[f"ONTIME_PCT_{w}"] = (_back(mean["ONTIME"].to_numpy()) * 100).round(1)
+        out[f"MEAN_DLY_WO_HNDLG_{w}"] = _back(mean["DLY_WO_HNDLG"].to_numpy()).round(1)
+        out[f"HNDLG_SHARE_PCT_{w}"] = (_back(mean["HNDLG"].to_numpy()) * 100).round(1)
+
+        airport = m.rolling(w, on="STD")["ONTIME"].mean()
+        out[f"ONTIME_PCT_{w}_ALL"] = airport.mul(100).round(1).to_numpy()
+    return out
+
+
+def write_ontime_report(df: pd.DataFrame, by: str = "STAND",
+                        heatmap_file: str = "OnTime_Heatmap.xlsx",
+                        rolling_file: str = "OnTime_Rolling.xlsx") -> tuple[str, str]:
+    """Scrive heatmap (by × giorno × ora) e finestre mobili per partenza in due file Excel."""
+    heat = ontime_heatmap(df, by)
+    if heat.empty:
+        print("Nessuna partenza con STD/ATD validi per la puntualità. Nessun file creato.")
+        return "", ""
+
+    path_heat = write_excel(heat, heatmap_file, sheet=f"ONTIME_{by}_HOUR")
+    print(f"File Excel creato: {path_heat}  (righe: {heat.shape[0]})")
+
+    roll = rolling_ontime(df, by)
+    path_roll = write_excel(roll, rolling_file, sheet="ONTIME_ROLLING")
+    print(f"File Excel creato: {path_roll}  (righe: {roll.shape[0]})")
+    return path_heat, path_roll
@@ -0,0 +1,313 @@
+# CNA_regression.py
+"""
+Harness di regressione "golden output" per CNA_rules.
+
+Esegue l'intera pipeline (prepare_df + tutte le regole) sul dataset demo e su
+dataset sintetici più grandi, intercetta i DataFrame passati a write_excel
+(valori + maschera delle evidenziazioni) e li confronta con gli output golden
+salvati in Parquet, con hash per colonna per saltare subito le colonne invariate.
+
+Uso:
+    python CNA_regression.py update [--synthetic 20 200]   # rigenera i golden (default: 20 200)
+    python CNA_regression.py check  [--synthetic 20 200]   # confronta (exit 1 se cambia qualcosa)
+
+I golden di demo, synthetic_x20 (3.000 righe) e synthetic_x200 (30.000 righe) sono
+versionati in golden/.
+Richiede pyarrow (solo per questo strumento, non per l'eseguibile): requirements-dev.txt.
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+import CNA_rules
+import TROVA_Ritardi
+from CNA_utils import base_dir
+
+DEMO_FILE = "demo_ops_dataset_150.tsv"
+DEMO_MONTH = 9
+DEFAULT_SYNTHETIC = (20, 200)
+HL_COL = "_HL"          # maschera evidenziazioni: una stringa di 0/1 per riga (una cifra per colonna)
+MAX_SAMPLE_ROWS = 10
+
+
+# ============================== dataset sintetici ==============================
+
+def make_synthetic(copies: int, path: str, seed: int = 0) -> str:
+    """
+    Replica il dataset demo copies volte (stesso formato grezzo a 64 colonne):
+    ID nuovi, giorno del mese casuale per ogni coppia A/D e ritardi perturbati.
+    Deterministico per (copies, seed).
+    """
+    raw = pd.read_csv(os.path.join(base_dir(), DEMO_FILE), sep="\t", dtype=str,
+                      keep_default_na=False)
+    cols = list(raw.columns)
+    c_link, c_date_op, c_std_d, c_std_t = cols[26], cols[0], cols[41], cols[30]
+    c_atd, c_atot = cols[63], cols[42]
+
+    rng = np.random.default_rng(seed)
+    n = len(raw)
+    big = pd.concat([raw] * copies, ignore_index=True)
+    copy_idx = np.repeat(np.arange(copies), n)
+
+    link = big[c_link].astype(str)
+    big[c_link] = pd.Series(copy_idx, index=big.index).astype(str).str.zfill(4) + link
+
+    # stesso giorno casuale (nel mese originale) per arrivo e partenza dello stesso ID
+    codes, uniq = pd.factorize(big[c_link])
+    day = rng.integers(1, 29, size=len(uniq))[codes]
+
+    std = pd.to_datetime(big[c_std_d] + " " + big[c_std_t], errors="coerce", dayfirst=True)
+    atd = pd.to_datetime(big[c_atd], errors="coerce", dayfirst=True)
+    delta = atd - std
+
+    month_start = std.dt.to_period("M").dt.start_time
+    new_std = month_start + pd.to_timedelta(day - 1, unit="D") + (std - std.dt.normalize())
+    noise = rng.normal(0, 15, size=len(big))
+    late = rng.random(len(big)) < 0.05
+    noise[late] += rng.integers(120, 300, size=int(late.sum()))
+    new_atd = new_std + delta + pd.to_timedelta(np.round(noise), unit="min")
+
+    big[c_date_op] = new_std.dt.strftime("%d/%m/%Y").fillna(big[c_date_op])
+    big[c_std_d] = new_std.dt.strftime("%d/%m/%Y").fillna(big[c_std_d])
+    big[c_atd] = new_atd.dt.strftime("%d/%m/%Y %H:%M").fillna(big[c_atd])
+    big[c_atot] = (new_atd + pd.Timedelta(minutes=8)).dt.strftime("%H:%M").fillna(big[c_atot])
+
+    big.to_csv(path, sep="\t", index=False)
+    return path
+
+
+# ============================== cattura output delle regole ==============================
+
+def _highlight_mask(df: pd.DataFrame, highlighter) -> pd.Series:
+    """Applica highlighter a un foglio openpyxl in memoria (senza salvarlo) e legge i fill."""
+    from openpyxl import Workbook
+
+    ncols = df.shape[1]
+    if highlighter is None or df.empty:
+        return pd.Series("0" * ncols, index=df.index)
+
+    ws = Workbook().active
+    ws.append(list(df.columns))
+    for row in df.astype(object).where(df.notna(), None).itertuples(index=False, name=None):
+        ws.append(list(row))
+    highlighter(ws, df)
+
+    flags = [
+        "".join("1" if c.fill is not None and c.fill.fill_type == "solid" else "0" for c in r)
+        for r in ws.iter_rows(min_row=2, max_row=df.shape[0] + 1, max_col=ncols)
+    ]
+    return pd.Series(flags, index=df.index)
+
+
+@contextlib.contextmanager
+def capture_outputs():
+    """Sostituisce write_excel in CNA_rules: raccoglie {sheet: DataFrame + _HL} invece di scrivere."""
+    captured: dict[str, pd.DataFrame] = {}
+
+    def _capture(df, filename, sheet, highlighter=None, **_):
+        out = df.reset_index(drop=True).copy()
+        out[HL_COL] = _highlight_mask(out, highlighter).to_numpy()
+        captured[sheet] = out
+        return ""
+
+    original = CNA_rules.write_excel
+    CNA_rules.write_excel = _capture
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield captured
+    finally:
+        CNA_rules.write_excel = original
+
+
+def run_case(file_path: str, month: int) -> dict[str, pd.DataFrame]:
+    """Pipeline completa su un file: output principale, anomalie e un output per regola."""
+    with capture_outputs() as captured:
+        df, anomalies = TROVA_Ritardi.prepare_df(file_path, month)
+        if not df.empty:
+            TROVA_Ritardi.run_rules(df)
+    outputs = {"MAIN": df.reset_index(drop=True), "ANOMALIES": anomalies.reset_index(drop=True)}
+    outputs.update(captured)
+    return {k: _canonical(v) for k, v in outputs.items()}
+
+
+def _canonical(df: pd.DataFrame) -> pd.DataFrame:
+    """Tipi stabili per Parquet e confronto: datetime/numerici invariati, il resto string."""
+    out = df.copy()
+    for c in out.columns:
+        s = out[c]
+        if pd.api.types.is_datetime64_any_dtype(s) or pd.api.types.is_bool_dtype(s):
+            continue
+        if pd.api.types.is_numeric_dtype(s):
+            out[c] = s.astype("Float64")
+            continue
+        out[c] = s.astype(object).where(s.notna(), None).astype("string")
+    out.columns = [str(c) for c in out.columns]
+    return out
+
+
+# ============================== golden: salvataggio e confronto ==============================
+
+def column_hashes(df: pd.DataFrame) -> dict[str, str]:
+    """Hash per colonna (valori, NA e ordine delle righe; indipendente dall'indice)."""
+    return {
+        c: hashlib.sha1(pd.util.hash_pandas_object(df[c], index=False).to_numpy().tobytes()).hexdigest()[:16]
+        for c in df.columns
+    }
+
+
+def _safe(name: str) -> str:
+    return "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in name)
+
+
+def save_golden(case_dir: str, outputs: dict[str, pd.DataFrame]):
+    os.makedirs(case_dir, exist_ok=True)
+    manifest = {}
+    for name, df in outputs.items():
+        fname = f"{_safe(name)}.parquet"
+        df.to_parquet(os.path.join(case_dir, fname), index=False)
+        manifest[name] = {"file": fname, "rows": int(df.shape[0]), "hashes": column_hashes(df)}
+    with open(os.path.join(case_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+
+def _align(old: pd.DataFrame, new: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame, int, int]:
+    """Allinea per ID (se univoco in entrambi) o per posizione. Restituisce anche righe tolte/aggiunte."""
+    if "ID" in old.columns and "ID" in new.columns and old["ID"].is_unique and new["ID"].is_unique:
+        o, n = old.set_index("ID", drop=False), new.set_index("ID", drop=False)
+        common = o.index.intersection(n.index)
+        return o.loc[common], n.loc[common], len(o.index.difference(n.index)), len(n.index.difference(o.index))
+    k = min(len(old), len(new))
+    return old.iloc[:k], new.iloc[:k], max(len(old) - k, 0), max(len(new) - k, 0)
+
+
+def diff_frames(old: pd.DataFrame, new: pd.DataFrame, old_hashes: dict[str, str]) -> dict:
+    """
+    Confronto vettoriale: colonne con hash invariato e stesse righe sono saltate;
+    per le altre conta celle con valore diverso, NA pattern diverso e maschera _HL diversa.
+    reordered segnala un cambio di ordine delle righe anche a parità di contenuto.
+    """
+    new_hashes = column_hashes(new)
+    res = {
+        "added_cols": sorted(set(new.columns) - set(old.columns)),
+        "removed_cols": sorted(set(old.columns) - set(new.columns)),
+        "rows_old": int(len(old)), "rows_new": int(len(new)),
+        "columns": {}, "changed_rows": pd.DataFrame(), "reordered": False,
+    }
+    if len(old) == len(new) and old_hashes == new_hashes:
+        return res
+
+    o, n, removed, added = _align(old, new)
+    res["rows_removed"], res["rows_added"] = removed, added
+    changed_any = pd.Series(False, index=range(len(o)))
+    sample = {}
+    for c in [c for c in new.columns if c in old.columns]:
+        if old_hashes.get(c) == new_hashes.get(c) and len(old) == len(new):
+            continue
+        a, b = o[c].reset_index(drop=True), n[c].reset_index(drop=True)
+        a_na, b_na = a.isna(), b.isna()
+        na_diff = a_na.ne(b_na)
+        both = ~a_na & ~b_na
+        val_diff = both & a.astype(object).where(both, "").ne(b.astype(object).where(both, ""))
+        cell_diff = na_diff | val_diff
+        if cell_diff.any():
+            key = "highlight" if c == HL_COL else "values"
+            res["columns"][c] = {key: int(val_diff.sum()), "na_pattern": int(na_diff.sum())}
+            changed_any |= cell_diff
+            sample[c] = a.astype(object).astype(str) + " -> " + b.astype(object).astype(str)
+    if changed_any.any():
+        rows = pd.DataFrame({c: s[changed_any] for c, s in sample.items()})
+        if "ID" in n.columns:
+            rows.insert(0, "ID", n["ID"].reset_index(drop=True)[changed_any])
+        res["changed_rows"] = rows
+
+    # l'ordine delle righe (per STD) fa parte dell'output: anche un solo riordino è un cambiamento.
+    # Con allineamento per ID si confronta la sequenza degli ID comuni; in ogni caso, hash
+    # diversi senza celle diverse né righe aggiunte/tolte significano righe riordinate.
+    if "ID" in old.columns and "ID" in new.columns:
+        ids_old = old["ID"][old["ID"].isin(new["ID"])].reset_index(drop=True)
+        ids_new = new["ID"][new["ID"].isin(old["ID"])].reset_index(drop=True)
+        res["reordered"] = not ids_old.equals(ids_new)
+    common = [c for c in new.columns if c in old.columns]
+    if not (res["columns"] or removed or added):
+        res["reordered"] = res["reordered"] or any(
+            old_hashes.get(c) != new_hashes.get(c) for c in common)
+    return res
+
+
+def check_case(case_dir: str, outputs: dict[str, pd.DataFrame]) -> bool:
+    """Stampa il confronto con i golden di case_dir. True se tutto invariato."""
+    with open(os.path.join(case_dir, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    ok = True
+    for name in sorted(set(manifest) | set(outputs)):
+        if name not in manifest:
+            print(f"  {name:<20} NUOVO (non presente nei golden)")
+            ok = False
+            continue
+        if name not in outputs:
+            print(f"  {name:<20} MANCANTE (presente nei golden, non prodotto)")
+            ok = False
+            continue
+        old = pd.read_parquet(os.path.join(case_dir, manifest[name]["file"]))
+        res = diff_frames(old, outputs[name], manifest[name]["hashes"])
+        if not (res["columns"] or res["added_cols"] or res["removed_cols"]
+                or res.get("rows_added") or res.get("rows_removed") or res["reordered"]):
+            print(f"  {name:<20} OK ({res['rows_new']} righe)")
+            continue
+        ok = False
+        print(f"  {name:<20} CAMBIATO: righe {res['rows_old']} -> {res['rows_new']} "
+              f"(+{res.get('rows_added', 0)} / -{res.get('rows_removed', 0)})")
+        if res["reordered"]:
+            print("    ordine delle righe cambiato")
+        if res["added_cols"] or res["removed_cols"]:
+            print(f"    colonne aggiunte: {res['added_cols']}  rimosse: {res['removed_cols']}")
+        for c, d in res["columns"].items():
+            print(f"    {c:<18} {d}")
+        if not res["changed_rows"].empty:
+            print(res["changed_rows"].head(MAX_SAMPLE_ROWS).to_string(index=False))
+    return ok
+
+
+# ============================== CLI ==============================
+
+def _cases(tmp: str, synthetic: list[int]):
+    yield "demo", os.path.join(base_dir(), DEMO_FILE), DEMO_MONTH
+    for copies in synthetic:
+        path = make_synthetic(copies, os.path.join(tmp, f"synthetic_x{copies}.tsv"))
+        yield f"synthetic_x{copies}", path, DEMO_MONTH
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Regressione golden output di CNA_rules.")
+    ap.add_argument("mode", choices=["update", "check"])
+    ap.add_argument("--synthetic", type=int, nargs="*", default=list(DEFAULT_SYNTHETIC),
+                    help="numero di copie del dataset demo per ogni caso sintetico")
+    ap.add_argument("--golden-dir", default=os.path.join(base_dir(), "golden"))
+    args = ap.parse_args(argv)
+
+    all_ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for case, path, month in _cases(tmp, args.synthetic):
+            outputs = run_case(path, month)
+            case_dir = os.path.join(args.golden_dir, case)
+            if args.mode == "update":
+                save_golden(case_dir, outputs)
+                print(f"{case}: golden aggiornati ({len(outputs)} output) in {case_dir}")
+            elif not os.path.exists(os.path.join(case_dir, "manifest.json")):
+                print(f"{case}: nessun golden in {case_dir} (eseguire prima 'update')")
+                all_ok = False
+            else:
+                print(f"{case}:")
+                all_ok &= check_case(case_dir, outputs)
+    return 0 if all_ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
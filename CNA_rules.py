@@ -171,12 +171,15 @@ def united(df: pd.DataFrame, filename: str = "Delays_UNITED.xlsx") -> str:
     return path
 
 
-def delta(df: pd.DataFrame, filename: str = "Delays_DELTA.xlsx") -> str:
+def delta(df: pd.DataFrame, filename: str = "Delays_DELTA.xlsx", summary=None,
+          ledger=None) -> str:
     """
     Allinea A e D per IATA='DL' su ID; calcola DLY_REAL; definisce SURCHARGE:
       - 30% se DLY_REAL>180 e 07:00≤ATD≤21:00 e nessuno dei due FLT_TYPE è 'FERRY'
       - 15% se DLY_REAL>180 e 07:00≤ATD≤21:00 e almeno uno è 'FERRY'
     Ordina per STD asc, evidenzia le righe con SURCHARGE valorizzato.
+    Se passato, summary (DelaySummary) conta i SURCHARGE per percentuale.
+    Se passato, ledger (CNA_billing.SurchargeLedger) accoda i turni da fatturare.
     """
     req = ["ID","A/D","TRANSPORT","FLT_TYPE","REG","MOD","MTOW","STAND","IATA",
            "FLT_N","FROM","TO","STD","ATD","DLY_1","DLY_1_t","DLY_2","DLY_2_t"]
@@ -251,6 +254,10 @@ def delta(df: pd.DataFrame, filename: str = "Delays_DELTA.xlsx") -> str:
         "DLY_REAL","DLY_1","DLY_1_t","DLY_2","DLY_2_t","SURCHARGE"
     ]
     out = out.loc[:, cols]
+    if summary is not None:
+        summary.observe_surcharge(out, "SURCHARGE")
+    if ledger is not None:
+        ledger.add(out, "SURCHARGE")
 
     def _hl(ws, df_):
         highlight_rows_by_nonempty(ws, df_, "SURCHARGE", color="FFFFFF00")
@@ -323,10 +330,13 @@ def ritardo_generico(df: pd.DataFrame, iata_code: str, min_minutes: int,
     return path
 
 
-def arkia(df: pd.DataFrame, filename: str = "Delays_ARKIA.xlsx") -> str:
+def arkia(df: pd.DataFrame, filename: str = "Delays_ARKIA.xlsx", summary=None,
+          ledger=None) -> str:
     """
     Partenze IATA='IZ', join con arrivo, DLY_REAL, DLY_WO_HNDLG, SURCHARGE per scaglioni
     (20% 91–120, 30% 121–180, 45% >180); evidenzia righe con SURCHARGE.
+    Se passato, summary (DelaySummary) conta i SURCHARGE per percentuale.
+    Se passato, ledger (CNA_billing.SurchargeLedger) accoda i turni da fatturare.
     """
     req = ["ID","A/D","TRANSPORT","FLT_TYPE","REG","MOD","MTOW","STAND","IATA",
            "FLT_N","FROM","TO","STD","ATD","DLY_1","DLY_1_t","DLY_2","DLY_2_t"]
@@ -382,6 +392,10 @@ def arkia(df: pd.DataFrame, filename: str = "Delays_ARKIA.xlsx") -> str:
     for c in final_cols:
         if c not in out.columns: out[c] = pd.NA
     out = out.loc[:, final_cols]
+    if summary is not None:
+        summary.observe_surcharge(out, "SURCHARGE")
+    if ledger is not None:
+        ledger.add(out, "SURCHARGE")
 
     def _hl(ws, df_):
         highlight_rows_by_nonempty(ws, df_, "SURCHARGE", color="FFFFFF00")
@@ -0,0 +1,208 @@
+# CNA_summary.py
+import json
+import os
+import numpy as np
+import pandas as pd
+from CNA_utils import base_dir, write_excel
+
+# Istogrammi a 1 minuto: percentili esatti per ritardi interi fino a MAX_MINUTES,
+# oltre si accumula nell'ultimo bin (il massimo reale è tenuto a parte)
+MAX_MINUTES = 2880
+THRESHOLDS = (15, 60, 120, 180)
+QUANTILES = (0.5, 0.9, 0.95)
+
+
+def _empty_stats() -> dict:
+    return {"n": 0, "n_na": 0, "sum": 0, "max": 0,
+            "hist": np.zeros(MAX_MINUTES + 1, dtype=np.int64)}
+
+
+class DelaySummary:
+    """
+    Statistiche dei ritardi accumulate in un solo passaggio (streaming) e unibili
+    tra mesi/shard senza rileggere le righe originali.
+
+    Per ogni chiave (METRIC, KEY) si tengono: righe viste, righe senza valore,
+    somma, massimo e istogramma a 1 minuto dei valori > 0. Le chiavi sono:
+      - (DLY_REAL | DLY_WO_HNDLG, vettore)   alimentate da compute_dly_real/_wo_handling
+      - ("DLY_CODE", codice)                  minuti imputati a ciascun codice ritardo
+    Se il DataFrame osservato ha la colonna A/D, si considerano solo le partenze (D).
+    I conteggi SURCHARGE sono per (vettore, percentuale).
+    """
+
+    def __init__(self, carrier_col: str = "IATA"):
+        self.carrier_col = carrier_col
+        self.stats: dict[tuple[str, str], dict] = {}
+        self.surcharge: dict[tuple[str, str], int] = {}
+
+    # ------------------------------------------------------------------ accumulo
+
+    def _departures(self, df: pd.DataFrame) -> pd.DataFrame:
+        if "A/D" in df.columns:
+            return df[df["A/D"].astype(str).str.strip().str.upper().eq("D")]
+        return df
+
+    def _carriers(self, df: pd.DataFrame) -> pd.Series:
+        if self.carrier_col in df.columns:
+            return df[self.carrier_col].astype(str).str.strip().str.upper()
+        return pd.Series("ALL", index=df.index)
+
+    def _add(self, metric: str, key: str, values: pd.Series):
+        """Aggiunge al bucket (metric, key) i valori (minuti, NA = nessun valore)."""
+        st = self.stats.setdefault((metric, key), _empty_stats())
+        num = pd.to_numeric(values, errors="coerce")
+        v = num.dropna().round().astype(np.int64).to_numpy()
+        v = v[v > 0]
+        st["n"] += int(num.size)
+        st["n_na"] += int(num.isna().sum())
+        if v.size:
+            st["sum"] += int(v.sum())
+            st["max"] = max(st["max"], int(v.max()))
+            st["hist"] += np.bincount(np.minimum(v, MAX_MINUTES), minlength=MAX_MINUTES + 1)
+
+    def observe(self, df: pd.DataFrame, metric_col: str):
+        """Accumula metric_col (minuti) per vettore."""
+        dep = self._departures(df)
+        if dep.empty or metric_col not in dep.columns:
+            return
+        for carrier, vals in dep[metric_col].groupby(self._carriers(dep), sort=False):
+            self._add(metric_col, carrier, vals)
+
+    def observe_codes(self, df: pd.DataFrame,
+                      code_cols: tuple[str, ...] = ("DLY_1", "DLY_2"),
+                      min_cols: tuple[str, ...] = ("DLY_1_t", "DLY_2_t")):
+        """Accumula i minuti imputati a ciascun codice ritardo (DLY_1/DLY_2)."""
+        dep = self._departures(df)
+        for code_col, min_col in zip(code_cols, min_cols):
+            if dep.empty or code_col not in dep.columns or min_col not in dep.columns:
+                continue
+            code = pd.to_numeric(dep[code_col], errors="coerce").astype("Int64")
+            mins = pd.to_numeric(dep[min_col], errors="coerce")
+            has_code = code.notna()
+            for c, vals in mins[has_code].groupby(code[has_code], sort=False):
+                self._add("DLY_CODE", f"{int(c):02d}", vals)
+
+    def observe_surcharge(self, df: pd.DataFrame, surcharge_col: str = "SURCHARGE"):
+        """Conta i turni con SURCHARGE valorizzato per (vettore, percentuale)."""
+        if df.empty or surcharge_col not in df.columns:
+            return
+        s = df[surcharge_col].fillna("").astype(str).str.strip()
+        has = s.ne("")
+        counts = pd.DataFrame({"C": self._carriers(df)[has], "S": s[has]}).value_counts()
+        for (carrier, pct), n in counts.items():
+            self.surcharge[(carrier, pct)] = self.surcharge.get((carrier, pct), 0) + int(n)
+
+    # ------------------------------------------------------------------ merge / persistenza
+
+    def merge(self, other: "DelaySummary") -> "DelaySummary":
+        """Unisce in self un riepilogo parziale (altro mese/shard). Restituisce self."""
+        for k, o in other.stats.items():
+            st = self.stats.setdefault(k, _empty_stats())
+            st["n"] += o["n"]
+            st["n_na"] += o["n_na"]
+            st["sum"] += o["sum"]
+            st["max"] = max(st["max"], o["max"])
+            st["hist"] += o["hist"]
+        for k, n in other.surcharge.items():
+            self.surcharge[k] = self.surcharge.get(k, 0) + n
+        return self
+
+    def to_json(self) -> dict:
+        """Forma serializzabile (istogrammi sparsi {minuto: conteggio})."""
+        return {
+            "carrier_col": self.carrier_col,
+            "max_minutes": MAX_MINUTES,
+            "stats": [
+                {"metric": m, "key": k, "n": st["n"], "n_na": st["n_na"],
+                 "sum": st["sum"], "max": st["max"],
+                 "hist": {str(i): int(st["hist"][i]) for i in np.flatnonzero(st["hist"])}}
+                for (m, k), st in self.stats.items()
+            ],
+            "surcharge": [{"carrier": c, "pct": p, "n": n} for (c, p), n in self.surcharge.items()],
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "DelaySummary":
+        if data.get("max_minutes", MAX_MINUTES) != MAX_MINUTES:
+            raise ValueError(
+                f"Riepilogo con max_minutes={data['max_minutes']} non compatibile (atteso {MAX_MINUTES})."
+            )
+        out = cls(carrier_col=data.get("carrier_col", "IATA"))
+        for s in data.get("stats", []):
+            st = out.stats[(s["metric"], s["key"])] = _empty_stats()
+            for f in ("n", "n_na", "sum", "max"):
+                st[f] = s[f]
+            for i, n in s["hist"].items():
+                st["hist"][int(i)] = n
+        for s in data.get("surcharge", []):
+            out.surcharge[(s["carrier"], s["pct"])] = s["n"]
+        return out
+
+    @classmethod
+    def load(cls, path: str) -> "DelaySummary":
+        with open(path, encoding="utf-8") as f:
+            return cls.from_json(json.load(f))
+
+    def save(self, filename: str = "Delay_Summary.json") -> str:
+        """Scrive il riepilogo parziale in JSON (cartella accanto all'eseguibile o al .py)."""
+        out_path = os.path.join(base_dir(), filename)
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_json(), f, indent=1)
+        return out_path
+
+    # ------------------------------------------------------------------ report
+
+    def to_frame(self) -> pd.DataFrame:
+        """Una riga per (METRIC, KEY): media/percentili sui valori > 0, conteggi per soglia."""
+        rows = []
+        for (metric, key), st in sorted(self.stats.items()):
+            hist = st["hist"]
+            n_pos = int(hist.sum())
+            row = {"METRIC": metric, "KEY": key, "N": st["n"], "N_NA": st["n_na"], "N_DLY": n_pos,
+                   "MEAN": round(st["sum"] / n_pos, 1) if n_pos else pd.NA}
+            cum = np.cumsum(hist)
+            for q in QUANTILES:
+                # nearest-rank sul cumulato; l'ultimo bin vale il massimo reale
+                idx = int(np.searchsorted(cum, np.ceil(q * n_pos))) if n_pos else None
+                row[f"P{int(q * 100)}"] = (pd.NA if idx is None
+                                            else st["max"] if idx >= MAX_MINUTES else idx)
+            row["MAX"] = st["max"] if n_pos else pd.NA
+            for t in THRESHOLDS:
+                row[f"GE_{t}"] = int(hist[min(t, MAX_MINUTES):].sum())
+            rows.append(row)
+        for (carrier, pct), n in sorted(self.surcharge.items()):
+            rows.append({"METRIC": f"SURCHARGE_{pct}", "KEY": carrier, "N": n})
+
+        cols = (["METRIC", "KEY", "N", "N_NA", "N_DLY", "MEAN"]
+                + [f"P{int(q * 100)}" for q in QUANTILES] + ["MAX"]
+                + [f"GE_{t}" for t in THRESHOLDS])
+        counts = [c for c in cols if c not in ("METRIC", "KEY", "MEAN")]
+        out = pd.DataFrame(rows, columns=cols)
+        # le righe SURCHARGE hanno solo N: senza cast i conteggi diventerebbero float (4.0)
+        out[counts] = out[counts].astype("Int64")
+        out["MEAN"] = out["MEAN"].astype("Float64")
+        return out
+
+
+def write_summary(summary: DelaySummary, filename: str = "Delay_Summary.xlsx",
+                  json_name: str | None = "Delay_Summary.json") -> str:
+    """Scrive il foglio di riepilogo (e, se json_name, il parziale JSON unibile)."""
+    out = summary.to_frame()
+    if out.empty:
+        print("Nessun dato per il riepilogo. Nessun file creato.")
+        return ""
+    if json_name:
+        summary.save(json_name)
+    path = write_excel(out, filename, sheet="SUMMARY")
+    print(f"File Excel creato: {path}  (righe: {out.shape[0]})")
+    return path
+
+
+def merge_summaries(paths: list[str], filename: str = "Delay_Summary_MERGED.xlsx",
+                    json_name: str | None = "Delay_Summary_MERGED.json") -> str:
+    """Unisce i parziali JSON (mesi/shard) e scrive il riepilogo complessivo."""
+    merged = DelaySummary()
+    for p in paths:
+        merged.merge(DelaySummary.load(p))
+        print(f"Riepilogo parziale unito: {p}")
+    return write_summary(merged, filename, json_name=json_name)
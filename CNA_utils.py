@@ -2,7 +2,6 @@
 import os
 import sys
 import pandas as pd
-from openpyxl.styles import PatternFill
 
 # Codici ritardo attribuibili all'handling (da sottrarre nel "senza handling")
 HANDLING_CODES = {12, 13, 15, 18, 31, 32, 33, 34, 35, 39, 52}
@@ -29,10 +28,16 @@ def ensure_datetime(df: pd.DataFrame, cols: list[str]) -> pd.DataFrame:
 def compute_dly_real(df: pd.DataFrame,
                      atd_col: str = "ATD",
                      std_col: str = "STD",
-                     out_col: str = "DLY_REAL") -> pd.DataFrame:
-    """Calcola il ritardo reale in minuti (ATD-STD), solo positivi, in out_col (Int64)."""
+                     out_col: str = "DLY_REAL",
+                     summary=None) -> pd.DataFrame:
+    """
+    Calcola il ritardo reale in minuti (ATD-STD), solo positivi, in out_col (Int64).
+    Se passato, summary (CNA_summary.DelaySummary) accumula out_col nello stesso passaggio.
+    """
     mins = (df[atd_col] - df[std_col]).dt.total_seconds().div(60)
     df[out_col] = mins.where(mins > 0).round().astype("Int64")
+    if summary is not None:
+        summary.observe(df, out_col)
     return df
 
 
@@ -41,10 +46,12 @@ def compute_dly_wo_handling(df: pd.DataFrame,
                             dly1_col: str = "DLY_1", dly1_min_col: str = "DLY_1_t",
                             dly2_col: str = "DLY_2", dly2_min_col: str = "DLY_2_t",
                             handling_codes: set[int] = HANDLING_CODES,
-                            out_col: str = "DLY_WO_HNDLG") -> pd.DataFrame:
+                            out_col: str = "DLY_WO_HNDLG",
+                            summary=None) -> pd.DataFrame:
     """
     Calcola il ritardo 'senza handling': DLY_REAL meno i minuti associati ai codici handling
     presenti in DLY_1/DLY_2. Risultato (Int64) clip ≥ 0.
+    Se passato, summary accumula out_col e i minuti per codice ritardo nello stesso passaggio.
     """
     d1_code = pd.to_numeric(df.get(dly1_col), errors="coerce").astype("Int64")
     d2_code = pd.to_numeric(df.get(dly2_col), errors="coerce").astype("Int64")
@@ -57,6 +64,9 @@ def compute_dly_wo_handling(df: pd.DataFrame,
     dly_real_num = pd.to_numeric(df.get(dly_real_col), errors="coerce").fillna(0)
     dly_wo = (dly_real_num - sub_d1 - sub_d2).clip(lower=0)
     df[out_col] = dly_wo.round().astype("Int64")
+    if summary is not None:
+        summary.observe(df, out_col)
+        summary.observe_codes(df, (dly1_col, dly2_col), (dly1_min_col, dly2_min_col))
     return df
 
 
@@ -83,6 +93,7 @@ def write_excel(df: pd.DataFrame, filename: str, sheet: str,
 
 def highlight_rows_by_nonempty(ws, df: pd.DataFrame, col_name: str, color: str = "FFFFFF00"):
     """Evidenzia INTERA RIGA se la cella col_name non è vuota."""
+    from openpyxl.styles import PatternFill  # import differito: serve solo in scrittura
     fill = PatternFill(fill_type="solid", start_color=color, end_color=color)
     col_idx = df.columns.get_loc(col_name) + 1  # 1-based
     max_row, max_col = ws.max_row, ws.max_column
@@ -96,6 +107,7 @@ def highlight_rows_by_nonempty(ws, df: pd.DataFrame, col_name: str, color: str =
 def highlight_rows_by_threshold(ws, df: pd.DataFrame, col_name: str, threshold: float,
                                 color: str = "FFFFFF00"):
     """Evidenzia INTERA RIGA se il valore numerico in col_name è ≥ threshold."""
+    from openpyxl.styles import PatternFill  # import differito: serve solo in scrittura
     fill = PatternFill(fill_type="solid", start_color=color, end_color=color)
     col_idx = df.columns.get_loc(col_name) + 1  # 1-based
     max_row, max_col = ws.max_row, ws.max_column
@@ -0,0 +1,126 @@
+# CNA_validation.py
+import pandas as pd
+from CNA_utils import write_excel
+
+# Codici ritardo IATA standard (AHM 730): 00-09 interni compagnia + famiglie 1x..9x
+IATA_DELAY_CODES = (
+    set(range(0, 10)) | set(range(11, 20)) | set(range(21, 30)) | set(range(31, 40)) |
+    set(range(41, 49)) | set(range(51, 59)) | set(range(61, 70)) | set(range(71, 78)) |
+    set(range(81, 90)) | set(range(91, 100))
+)
+
+# Colonne del report anomalie (ordine finale)
+ANOMALY_COLS = ["CHECK", "ID", "A/D", "IATA", "FLT_N", "STD", "ATD", "DETAIL"]
+
+
+def _rows(df: pd.DataFrame, mask: pd.Series, check: str, detail: pd.Series | str) -> pd.DataFrame:
+    """Estrae le righe di df che soddisfano mask nel formato del report anomalie."""
+    mask = mask.fillna(False).astype(bool)
+    out = df.loc[mask].reindex(columns=[c for c in ANOMALY_COLS if c not in ("CHECK", "DETAIL")])
+    out.insert(0, "CHECK", check)
+    out["DETAIL"] = detail[mask] if isinstance(detail, pd.Series) else detail
+    return out
+
+
+def validate_ops(df: pd.DataFrame, month: int | None = None,
+                 bad_lines: list | None = None,
+                 atd_raw: pd.Series | None = None,
+                 max_early_hours: float = 2,
+                 dly_tolerance: int = 0,
+                 known_codes: set[int] = IATA_DELAY_CODES) -> pd.DataFrame:
+    """
+    Controlli di qualità vettoriali sul DataFrame appena caricato (STD/ATD già datetime,
+    A/D già normalizzato). Restituisce un report compatto con una riga per anomalia:
+      - BAD_LINE:         righe con numero di campi errato (analizzate comunque, come
+                          completate o troncate dal parser); bad_lines = [(riga, campi)]
+      - STD_UNPARSABLE:   data/ora schedulata non interpretabile
+      - MISSING_ATD:      partenza senza ATD (vuoto o non interpretabile)
+      - ATD_BEFORE_STD:   ATD anticipato di oltre max_early_hours rispetto a STD
+      - DLY_SUM_MISMATCH: DLY_1_t + DLY_2_t diverso da DLY_REAL (oltre dly_tolerance)
+      - UNKNOWN_DLY_CODE: codice in DLY_1/DLY_2 non presente in known_codes
+      - ORPHAN_ARRIVAL:   arrivo senza partenza con lo stesso ID
+      - DUPLICATE_ID:     più righe con stessa coppia ID + A/D
+    atd_raw (ATD come testo prima del parsing) serve solo a distinguere ATD vuoto da
+    ATD non interpretabile. Se month è indicato, il report è limitato ai voli con STD
+    nel mese (più le righe con STD mancante, che non si possono attribuire).
+    """
+    ad = df["A/D"].astype(str).str.strip().str.upper()
+    is_dep = ad.eq("D")
+    is_arr = ad.eq("A")
+    std, atd = df["STD"], df["ATD"]
+
+    raw_atd = atd_raw if atd_raw is not None else pd.Series("", index=df.index)
+    raw_atd = raw_atd.fillna("").astype(str).str.strip()
+
+    mins = (atd - std).dt.total_seconds().div(60)
+    dly_real = mins.where(mins > 0).round()
+
+    d1_code_raw = df["DLY_1"].fillna("").astype(str).str.strip()
+    d2_code_raw = df["DLY_2"].fillna("").astype(str).str.strip()
+    d1_min = pd.to_numeric(df["DLY_1_t"], errors="coerce").fillna(0)
+    d2_min = pd.to_numeric(df["DLY_2_t"], errors="coerce").fillna(0)
+    imput_sum = (d1_min + d2_min).round()
+
+    parts = []
+
+    if bad_lines:
+        bad = pd.DataFrame({c: pd.NA for c in ANOMALY_COLS}, index=range(len(bad_lines)))
+        bad["CHECK"] = "BAD_LINE"
+        bad["DETAIL"] = [f"riga {n}: {len(f)} campi: " + " | ".join(map(str, f))
+                         for n, f in bad_lines]
+        parts.append(bad)
+
+    parts.append(_rows(df, std.isna(), "STD_UNPARSABLE",
+                       "STD_1/STD_2 non interpretabili"))
+
+    missing_atd = is_dep & std.notna() & atd.isna()
+    parts.append(_rows(df, missing_atd, "MISSING_ATD",
+                       raw_atd.where(raw_atd.eq(""), "ATD non interpretabile: " + raw_atd)
+                              .replace("", "ATD assente")))
+
+    early = is_dep & mins.lt(-60 * max_early_hours)
+    parts.append(_rows(df, early, "ATD_BEFORE_STD",
+                       "ATD anticipato di " + (-mins).round().astype("Int64").astype(str) + " min"))
+
+    mismatch = is_dep & dly_real.notna() & (imput_sum - dly_real).abs().gt(dly_tolerance)
+    parts.append(_rows(df, mismatch, "DLY_SUM_MISMATCH",
+                       "DLY_1_t+DLY_2_t=" + imput_sum.astype("Int64").astype(str)
+                       + " vs DLY_REAL=" + dly_real.astype("Int64").astype(str)))
+
+    for code_raw, name in ((d1_code_raw, "DLY_1"), (d2_code_raw, "DLY_2")):
+        code = pd.to_numeric(code_raw, errors="coerce")
+        unknown = code_raw.ne("") & ~code.isin(known_codes)
+        parts.append(_rows(df, unknown, "UNKNOWN_DLY_CODE", f"{name}=" + code_raw))
+
+    dep_ids = df.loc[is_dep, "ID"].dropna().unique()
+    orphan = is_arr & ~df["ID"].isin(dep_ids)
+    parts.append(_rows(df, orphan, "ORPHAN_ARRIVAL", "nessuna partenza con stesso ID"))
+
+    dup = df["ID"].notna() & pd.DataFrame({"ID": df["ID"], "A/D": ad}).duplicated(keep=False)
+    parts.append(_rows(df, dup, "DUPLICATE_ID", "ID ripetuto per " + ad))
+
+    report = pd.concat(parts, ignore_index=True)
+    report["STD"] = pd.to_datetime(report["STD"], errors="coerce")
+    report["ATD"] = pd.to_datetime(report["ATD"], errors="coerce")
+
+    if month is not None:
+        report = report[report["STD"].isna() | report["STD"].dt.month.eq(month)]
+
+    report = report.sort_values(["CHECK", "STD"], na_position="last").reset_index(drop=True)
+    return report.loc[:, ANOMALY_COLS]
+
+
+def write_anomaly_report(report: pd.DataFrame, filename: str = "Anomalies.xlsx") -> str:
+    """Stampa il riepilogo per tipo di controllo e scrive il report anomalie in Excel."""
+    if report.empty:
+        print("Nessuna anomalia rilevata. Nessun file creato.")
+        return ""
+
+    counts = report["CHECK"].value_counts().sort_index()
+    print("Anomalie rilevate:")
+    for check, n in counts.items():
+        print(f"  {check:<18} {n}")
+
+    path = write_excel(report, filename, sheet="ANOMALIES")
+    print(f"File Excel creato: {path}  (righe: {report.shape[0]})")
+    return path
@@ -1,7 +1,15 @@
-import pandas as pd
+from __future__ import annotations
 import sys
 import os
-import CNA_rules
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# pandas, openpyxl e i moduli CNA_* sono importati in modo differito: l'avvio
+# (specie come eseguibile PyInstaller) mostra subito il prompt e il caricamento
+# pesante avviene in background, vedi _preload_modules()
 
 # Indici delle colonne da mantenere (partendo da 0) — ordine finale desiderato
 COLUMNS_TO_KEEP_IDX = [26,10,14,12,27,16,62,7,8,2,3,1,28,41,30,19,23,20,24,63,42]
@@ -28,7 +36,39 @@ def _validate_indices(header: list, idx_list: list):
             f"Gli indici {bad} non esistono. Numero colonne trovate: {len(header)} (max indice {max_idx})."
         )
 
+def _preload_modules():
+    """Importa in background i moduli pesanti mentre l'utente risponde ai prompt."""
+    try:
+        import pandas  # noqa: F401
+        import CNA_rules  # noqa: F401
+        import CNA_validation  # noqa: F401
+        import CNA_summary  # noqa: F401
+        import CNA_billing  # noqa: F401
+        import CNA_ontime  # noqa: F401
+    except Exception:
+        # l'eventuale errore viene sollevato di nuovo dall'import nel thread principale
+        pass
+
+def _scan_bad_lines(file_path: str, n_cols: int) -> list:
+    """
+    Righe con un numero di campi diverso dall'intestazione, come (riga nel file, campi).
+    Con usecols il parser le analizza comunque (completa i campi mancanti, ignora quelli
+    in più) senza segnalarle: questa passata serve solo al report anomalie.
+    """
+    import csv
+    bad = []
+    with open(file_path, encoding="utf-8", newline="") as f:
+        reader = csv.reader(f, delimiter="\t")
+        next(reader, None)
+        start = reader.line_num + 1
+        for fields in reader:
+            if fields and len(fields) != n_cols:
+                bad.append((start, fields))
+            start = reader.line_num + 1
+    return bad
+
 def load_txt_to_df(file_path: str, usecols_idx=None, new_names=None) -> pd.DataFrame:
+    import pandas as pd
     header_only = pd.read_csv(file_path, sep="\t", dtype=str, nrows=0, engine="python")
     original_cols = list(header_only.columns)
     idx_list = usecols_idx or []
@@ -65,11 +105,13 @@ def load_txt_to_df(file_path: str, usecols_idx=None, new_names=None) -> pd.DataF
         )
         df["STD"] = std_sort
     else:
+        df.attrs["bad_lines"] = _scan_bad_lines(file_path, len(original_cols))
         return df
 
     df["_STD_SORT"] = std_sort
     df = df.sort_values("_STD_SORT", ascending=True).drop(columns=["_STD_SORT"]).reset_index(drop=True)
 
+    df.attrs["bad_lines"] = _scan_bad_lines(file_path, len(original_cols))
     return df
 
 def ask_month() -> int:
@@ -84,17 +126,145 @@ def ask_month() -> int:
             return m
         print("Mese non valido. Inserisci un numero da 1 a 12.")
 
-def _format_DLY_REAL(td: pd.Timedelta):
-    """Ritorna i minuti totali (int) se td>0, altrimenti pd.NA."""
-    if pd.isna(td):
-        return pd.NA
-    total_sec = td.total_seconds()
-    if total_sec <= 0:
-        return pd.NA
-    return int(round(total_sec / 60))
+def prepare_df(file_path: str, month: int, summary=None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Carica il file, controlla la qualità dei dati, tiene le partenze del mese (con i
+    relativi arrivi), normalizza e calcola DLY_REAL.
+    Restituisce (df pronto per le regole, report anomalie); df è vuoto se il mese non ha voli.
+    Se passato, summary (CNA_summary.DelaySummary) accumula le statistiche nello stesso passaggio.
+    """
+    import pandas as pd
+    import CNA_validation
+    from CNA_utils import compute_dly_real, compute_dly_wo_handling
+
+    df = load_txt_to_df(
+        file_path,
+        usecols_idx=COLUMNS_TO_KEEP_IDX,
+        new_names=NEW_COLUMN_NAMES
+    )
+
+    # STD (datetime) è già creato da load_txt_to_df; pulisci ATD (datetime)
+    atd_raw = df["ATD"]
+    df["ATD"] = pd.to_datetime(df["ATD"].astype(str).str.strip(), errors="coerce", dayfirst=True)
+
+    # Filtra per mese su STD (ignora NaT)
+    # Normalizza A/D PRIMA del filtro (e rimuovi la stessa riga più sotto)
+    df["A/D"] = df["A/D"].astype(str).str.strip().str.upper().replace({"P": "D"})
+
+    # Controlli di qualità sullo stesso DataFrame caricato (nessuna rilettura del file)
+    anomalies = CNA_validation.validate_ops(
+        df, month=month, bad_lines=df.attrs.get("bad_lines"), atd_raw=atd_raw
+    )
+
+    # 1) Tieni SOLO le PARTENZE (D) del mese richiesto
+    mask_dep = df["STD"].notna() & df["A/D"].eq("D") & (df["STD"].dt.month == month)
+    df_dep = df[mask_dep].copy()
+
+    # 2) Recupera gli ARRIVI (A) per gli stessi ID, anche se di mesi diversi
+    ids = df_dep["ID"].dropna().unique()
+    df_arr = df[df["A/D"].eq("A") & df["ID"].isin(ids)].copy()
+
+    # 3) Ricompone il DF da passare alle funzioni
+    df = pd.concat([df_dep, df_arr], ignore_index=True)
+
+    if df.empty:
+        return df, anomalies
+
+    # Rimuovo STD_1 e STD_2
+    df = df.drop(columns=["STD_1", "STD_2"])
+
+    # Riposiziono STD e ATD subito dopo TO
+    cols = list(df.columns)
+    to_index = cols.index("TO")
+    for col in ["STD", "ATD"]:
+        if col in cols:
+            cols.remove(col)
+    cols[to_index+1:to_index+1] = ["STD", "ATD"]
+    df = df[cols]
+
+    # ====== NORMALIZZAZIONI RICHIESTE (prima delle funzioni) ======
+
+    # 1) A/D: tutte le P -> D (lasciando A invariato)
+    df["A/D"] = df["A/D"].astype(str).str.strip().str.upper().replace({"P": "D"})
+
+    # 2) TRANSPORT: mapping richiesto -> inglese
+    tr_map = {
+        "PASSEGGERI": "PASSENGERS",
+        "SCALO TECNICO": "PASSENGERS",
+        "VARI": "PASSENGERS",
+        "CARGO": "FREIGHTER",
+        "POSTALE": "FREIGHTER",
+    }
+    df["TRANSPORT"] = df["TRANSPORT"].astype(str).str.strip().str.upper().replace(tr_map)
+
+    # 3) FLT_TYPE (ex VOLO): mapping richiesto -> inglese
+    def _map_flt_type(x: str) -> str:
+        s = str(x).strip().upper()
+        if s == "LINEA":
+            return "SCHEDULE"
+        if s == "BIS":
+            return "EXTRA"
+        if s == "STATO":
+            return "STATE"
+        if s in {"FERRY/POSIZIONAMENTO", "FERRY / POSIZIONAMENTO", "FERRY-POSIZIONAMENTO", "POSIZIONAMENTO", "FERRY"}:
+            return "FERRY"
+        if s == "VOLO TECNICO":
+            return "TECHNICAL"
+        return s
+    df["FLT_TYPE"] = df["FLT_TYPE"].apply(_map_flt_type)
+
+    # =============================================================
+
+    # Calcolo DLY_REAL = ATD - STD in minuti (vuoto se <=0 o mancante);
+    # il riepilogo statistico si accumula nello stesso passaggio (solo partenze)
+    df = compute_dly_real(df, "ATD", "STD", "DLY_REAL", summary=summary)
+    if summary is not None:
+        # solo per il riepilogo: bastano le colonne usate da compute_dly_wo_handling
+        compute_dly_wo_handling(
+            df[["A/D", "IATA", "DLY_REAL", "DLY_1", "DLY_1_t", "DLY_2", "DLY_2_t"]].copy(),
+            summary=summary
+        )
+
+    # Posiziono DLY_REAL subito dopo ATD
+    cols = list(df.columns)
+    if "DLY_REAL" in cols:
+        cols.remove("DLY_REAL")
+        atd_idx = cols.index("ATD")
+        cols[atd_idx+1:atd_idx+1] = ["DLY_REAL"]
+        df = df[cols]
+
+    return df, anomalies
+
+def run_rules(df: pd.DataFrame, summary=None, ledger=None):
+    """Lancia tutte le regole per vettore sul DataFrame normalizzato (un file Excel ciascuna)."""
+    import CNA_rules
+
+    CNA_rules.delta(df, summary=summary, ledger=ledger)
+    CNA_rules.etihad(df)
+    CNA_rules.united(df)
+    CNA_rules.arkia(df, summary=summary, ledger=ledger)
+    CNA_rules.ritardo_generico(df, "3U",60, "Delays_SICHUAN.xlsx")
+    CNA_rules.ritardo_generico(df, "CZ",120, "Delays_CHINA_SOUTHERN.xlsx")
+    CNA_rules.ritardo_generico(df, "MU",120, "Delays_CHINA_EASTERN.xlsx")
+    CNA_rules.anticipo_generico(df, "AR", 120, "Advance_AEROLINAS_ARGENTINAS.xlsx")
+    CNA_rules.anticipo_generico(df, "CI", 60, "Advance_CHINA_AIRLINES.xlsx")
 
 
 if __name__ == "__main__":
+    # --server: il processo resta attivo dopo ogni analisi (interprete e moduli già caldi)
+    server_mode = "--server" in sys.argv[1:]
+
+    # parziali Delay_Summary_*.json passati come argomenti (anche trascinati sull'eseguibile):
+    # si uniscono in Delay_Summary_MERGED.xlsx/.json e si esce
+    summary_parts = [a for a in sys.argv[1:] if a.lower().endswith(".json")]
+    if summary_parts:
+        import CNA_summary
+        CNA_summary.merge_summaries(summary_parts)
+        sys.exit(0)
+
+    _warmup = threading.Thread(target=_preload_modules, daemon=True)
+    _warmup.start()
+
     while True:
         print("Trascina qui il file .txt e premi Invio:")
         file_path = input().strip().strip('"')
@@ -106,97 +276,23 @@ if __name__ == "__main__":
 
             print("Analisi dati in corso...")
 
-            df = load_txt_to_df(
-                file_path,
-                usecols_idx=COLUMNS_TO_KEEP_IDX,
-                new_names=NEW_COLUMN_NAMES
-            )
-
-            # Crea STD (datetime) e pulisci ATD (datetime)
-            df["STD"] = pd.to_datetime(
-                df["STD_1"].astype(str) + " " + df["STD_2"].astype(str),
-                errors="coerce",
-                dayfirst=True
-            )
-            df["ATD"] = pd.to_datetime(df["ATD"].astype(str).str.strip(), errors="coerce", dayfirst=True)
-
-            # Filtra per mese su STD (ignora NaT)
-            # Normalizza A/D PRIMA del filtro (e rimuovi la stessa riga più sotto)
-            df["A/D"] = df["A/D"].astype(str).str.strip().str.upper().replace({"P": "D"})
+            _warmup.join()
+            import CNA_validation
+            import CNA_summary
+            import CNA_billing
+            import CNA_ontime
 
-            # 1) Tieni SOLO le PARTENZE (D) del mese richiesto
-            mask_dep = df["STD"].notna() & df["A/D"].eq("D") & (df["STD"].dt.month == month)
-            df_dep = df[mask_dep].copy()
-
-            # 2) Recupera gli ARRIVI (A) per gli stessi ID, anche se di mesi diversi
-            ids = df_dep["ID"].dropna().unique()
-            df_arr = df[df["A/D"].eq("A") & df["ID"].isin(ids)].copy()
-
-            # 3) Ricompone il DF da passare alle funzioni
-            df = pd.concat([df_dep, df_arr], ignore_index=True)
+            summary = CNA_summary.DelaySummary()
+            df, anomalies = prepare_df(file_path, month, summary=summary)
 
+            # report anomalie subito: va prodotto anche se il mese non ha voli
+            CNA_validation.write_anomaly_report(anomalies)
 
             if df.empty:
                 print(f"\nNessun volo trovato per il mese {month:02d} nel file selezionato.")
                 print("Riavvio del programma...\n")
                 continue
 
-            # Rimuovo STD_1 e STD_2
-            df = df.drop(columns=["STD_1", "STD_2"])
-
-            # Riposiziono STD e ATD subito dopo TO
-            cols = list(df.columns)
-            to_index = cols.index("TO")
-            for col in ["STD", "ATD"]:
-                if col in cols:
-                    cols.remove(col)
-            cols[to_index+1:to_index+1] = ["STD", "ATD"]
-            df = df[cols]
-
-            # ====== NORMALIZZAZIONI RICHIESTE (prima delle funzioni) ======
-
-            # 1) A/D: tutte le P -> D (lasciando A invariato)
-            df["A/D"] = df["A/D"].astype(str).str.strip().str.upper().replace({"P": "D"})
-
-            # 2) TRANSPORT: mapping richiesto -> inglese
-            tr_map = {
-                "PASSEGGERI": "PASSENGERS",
-                "SCALO TECNICO": "PASSENGERS",
-                "VARI": "PASSENGERS",
-                "CARGO": "FREIGHTER",
-                "POSTALE": "FREIGHTER",
-            }
-            df["TRANSPORT"] = df["TRANSPORT"].astype(str).str.strip().str.upper().replace(tr_map)
-
-            # 3) FLT_TYPE (ex VOLO): mapping richiesto -> inglese
-            def _map_flt_type(x: str) -> str:
-                s = str(x).strip().upper()
-                if s == "LINEA":
-                    return "SCHEDULE"
-                if s == "BIS":
-                    return "EXTRA"
-                if s == "STATO":
-                    return "STATE"
-                if s in {"FERRY/POSIZIONAMENTO", "FERRY / POSIZIONAMENTO", "FERRY-POSIZIONAMENTO", "POSIZIONAMENTO", "FERRY"}:
-                    return "FERRY"
-                if s == "VOLO TECNICO":
-                    return "TECHNICAL"
-                return s
-            df["FLT_TYPE"] = df["FLT_TYPE"].apply(_map_flt_type)
-
-            # =============================================================
-
-            # Calcolo DLY_REAL = ATD - STD in minuti (vuoto se <=0 o mancante)
-            df["DLY_REAL"] = (df["ATD"] - df["STD"]).apply(_format_DLY_REAL)
-
-            # Posiziono DLY_REAL subito dopo ATD
-            cols = list(df.columns)
-            if "DLY_REAL" in cols:
-                cols.remove("DLY_REAL")
-                atd_idx = cols.index("ATD")
-                cols[atd_idx+1:atd_idx+1] = ["DLY_REAL"]
-                df = df[cols]
-
             # Salvataggio Excel nella stessa cartella del .py
             script_dir = _base_dir()
             output_path = os.path.join(script_dir, "output.xlsx")
@@ -205,17 +301,31 @@ if __name__ == "__main__":
             print(f"\nOUTPUT principale eseguito.\nFile Excel salvato in: {output_path}")
 
             # LANCIO FUNZIONI DOPO LE NORMALIZZAZIONI
-            CNA_rules.delta(df)
-            CNA_rules.etihad(df)
-            CNA_rules.united(df)
-            CNA_rules.arkia(df)
-            CNA_rules.ritardo_generico(df, "3U",60, "Delays_SICHUAN.xlsx")
-            CNA_rules.ritardo_generico(df, "CZ",120, "Delays_CHINA_SOUTHERN.xlsx")
-            CNA_rules.ritardo_generico(df, "MU",120, "Delays_CHINA_EASTERN.xlsx")
-            CNA_rules.anticipo_generico(df, "AR", 120, "Advance_AEROLINAS_ARGENTINAS.xlsx")
-            CNA_rules.anticipo_generico(df, "CI", 60, "Advance_CHINA_AIRLINES.xlsx")
-            
-            break  # completato con successo
+            ledger = CNA_billing.SurchargeLedger()
+            run_rules(df, summary=summary, ledger=ledger)
+
+            # Fatturazione surcharge: solo se accanto al programma c'è tariffs.csv
+            tariffs = CNA_billing.load_tariffs()
+            if tariffs is None:
+                print("tariffs.csv non trovato: fatturazione surcharge saltata.")
+            else:
+                ledger.commit(tariffs)
+                ledger.export_csv()
+
+            # Analisi opzionali: un errore qui non deve bloccare report e fatturazione
+            try:
+                stem = os.path.splitext(os.path.basename(file_path))[0]
+                CNA_summary.write_summary(summary, json_name=f"Delay_Summary_{month:02d}_{stem}.json")
+            except Exception as e:
+                print(f"\nErrore nel riepilogo ritardi (report e fatturazione già completati): {e}")
+            try:
+                CNA_ontime.write_ontime_report(df)
+            except Exception as e:
+                print(f"\nErrore nel report di puntualità (report e fatturazione già completati): {e}")
+
+            if not server_mode:
+                break  # completato con successo
+            print("\nModalità server: pronto per un nuovo file (Ctrl+C per uscire).\n")
 
         except KeyboardInterrupt:
             print("\nInterrotto dall'utente.")
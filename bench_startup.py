@@ -0,0 +1,46 @@
+# bench_startup.py
+"""
+Benchmark dei tempi di import (avvio a freddo) dei moduli del progetto.
+Ogni misura gira in un processo Python nuovo, come al lancio dell'eseguibile.
+
+Uso:  python bench_startup.py [ripetizioni]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# (etichetta, codice eseguito nel processo figlio)
+TARGETS = [
+    ("python (vuoto)",           "pass"),
+    ("TROVA_Ritardi (avvio)",    "import TROVA_Ritardi"),
+    ("pandas",                   "import pandas"),
+    ("openpyxl",                 "import openpyxl"),
+    ("CNA_utils",                "import CNA_utils"),
+    ("CNA_rules + validation",   "import CNA_rules, CNA_validation"),
+]
+
+
+def time_import(code: str, runs: int) -> list[float]:
+    """Tempo (s) di avvio di un interprete nuovo che esegue code, ripetuto runs volte."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=here, check=True,
+                       stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{'modulo':<26}{'min (ms)':>10}{'mediana (ms)':>14}")
+    for label, code in TARGETS:
+        try:
+            t = time_import(code, runs)
+        except subprocess.CalledProcessError:
+            print(f"{label:<26}{'errore di import':>24}")
+            continue
+        print(f"{label:<26}{min(t) * 1000:>10.0f}{statistics.median(t) * 1000:>14.0f}")
@@ -0,0 +1,103 @@
+import os
+import sqlite3
+import pandas as pd
+import pytest
+import CNA_billing
+
+TARIFFS = """CARRIER;FLT_TYPE;MOD;MTOW_MIN;MTOW_MAX;HANDLING_FEE;CURRENCY
+DL;*;*;;;1000,00;USD
+DL;FERRY;*;;;1500,00;USD
+DL;*;*;;;999,00;USD
+IZ;*;*;0;100;200;EUR
+IZ;*;*;100;200;300;EUR
+IZ;*;*;;;5000;
+"""
+
+
+@pytest.fixture
+def tariffs(tmp_path) -> pd.DataFrame:
+    path = tmp_path / "tariffs.csv"
+    path.write_text(TARIFFS, encoding="utf-8")
+    return CNA_billing.load_tariffs(str(path))
+
+
+def _turns(surcharge: str = "30%") -> pd.DataFrame:
+    """Uscita di delta: un turno normale e uno con arrivo FERRY e partenza di linea."""
+    std = pd.to_datetime(["2025-09-01 10:00", "2025-09-02 10:00"])
+    return pd.DataFrame({
+        "IATA": ["DL", "DL"],
+        "ID": ["1", "2"],
+        "FLT_N_OUT": ["0100", "0200"],
+        "STD": std,
+        "ATD": std + pd.Timedelta("4h"),
+        "FLT_TYPE_A": ["SCHEDULED", "FERRY"],
+        "FLT_TYPE_D": ["SCHEDULED", "SCHEDULED"],
+        "MOD": ["332", "332"],
+        "MTOW": ["230", "230"],
+        "SURCHARGE": [surcharge, "15%"],
+    })
+
+
+def _ledger_rows(ledger) -> pd.DataFrame:
+    with sqlite3.connect(ledger.path) as conn:
+        return pd.read_sql_query("SELECT * FROM ledger ORDER BY ID", conn)
+
+
+def test_price_most_specific_then_first_row_and_inclusive_mtow(tariffs):
+    assert tariffs["CURRENCY"].ne("").all()
+    turns = pd.DataFrame({
+        "CARRIER": ["DL", "DL", "IZ", "IZ", "IZ", "IZ"],
+        "FLT_TYPE": ["FERRY", "SCHEDULED", "SCHEDULED", "SCHEDULED", "SCHEDULED", "SCHEDULED"],
+        "MOD": ["332"] * 6,
+        "MTOW": ["230", "230", "0", "100", "200", "200,5"],
+        "SURCHARGE": ["15%", "30%", "20%", "20%", "20%", "20%"],
+    })
+    out = CNA_billing.price_surcharges(turns, tariffs)
+
+    # FERRY esatto batte "*"; a parità vale la prima riga (1000, non 999);
+    # estremi MTOW inclusi, 100 in entrambe le fasce -> prima riga; oltre 200 nessuna tariffa
+    assert out["HANDLING_FEE"].tolist()[:5] == [1500, 1000, 200, 200, 300]
+    assert out["AMOUNT"].tolist()[:5] == [225, 300, 40, 40, 60]
+    assert pd.isna(out.loc[5, "AMOUNT"])
+
+
+def test_commit_twice_inserts_nothing_and_lists_changed_amounts(tmp_path, tariffs, capsys):
+    ledger = CNA_billing.SurchargeLedger(str(tmp_path / "ledger.sqlite"))
+    ledger.add(_turns())
+    assert ledger.commit(tariffs) == 2
+
+    ledger.add(_turns())
+    assert ledger.commit(tariffs) == 0
+    assert "da rettificare" not in capsys.readouterr().out
+
+    rows = _ledger_rows(ledger)
+    # arrivo FERRY: prezzato con la tariffa FERRY, come la percentuale di delta
+    assert rows["FLT_TYPE"].tolist() == ["SCHEDULED", "FERRY"]
+    assert rows["AMOUNT"].tolist() == [300, 225]
+
+    ledger.add(_turns(surcharge="15%"))
+    assert ledger.commit(tariffs) == 0
+    out = capsys.readouterr().out
+    assert "da rettificare" in out
+    assert "DL ID=1 SURCHARGE 30% -> 15% AMOUNT 300.00 -> 150.00 USD" in out
+    assert _ledger_rows(ledger)["AMOUNT"].tolist() == [300, 225]
+
+
+def test_export_rolls_back_batch_when_csv_fails(tmp_path, tariffs, monkeypatch):
+    ledger = CNA_billing.SurchargeLedger(str(tmp_path / "ledger.sqlite"))
+    ledger.add(_turns())
+    ledger.commit(tariffs)
+    csv_path = str(tmp_path / "Billing.csv")
+
+    def _fail(*args, **kwargs):
+        raise OSError("disco pieno")
+    monkeypatch.setattr(pd.DataFrame, "to_csv", _fail)
+    with pytest.raises(OSError):
+        ledger.export_csv(csv_path)
+    assert _ledger_rows(ledger)["EXPORT_BATCH"].isna().all()
+    assert not os.path.exists(csv_path)
+
+    monkeypatch.undo()
+    assert ledger.export_csv(csv_path) == csv_path
+    assert _ledger_rows(ledger)["EXPORT_BATCH"].notna().all()
+    assert ledger.export_csv(str(tmp_path / "Billing_2.csv")) == ""
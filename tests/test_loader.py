@@ -0,0 +1,59 @@
+import os
+import TROVA_Ritardi as T
+
+DEMO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                    "demo_ops_dataset_150.tsv")
+
+
+def _demo_copy(tmp_path, edit) -> str:
+    """Copia del file demo con edit(numero di riga, campi) -> campi applicato a ogni riga dati."""
+    with open(DEMO, encoding="utf-8", newline="") as f:
+        lines = f.read().splitlines()
+    out = [lines[0]] + ["\t".join(edit(n, line.split("\t"))) for n, line in enumerate(lines[1:], start=2)]
+    path = tmp_path / "ops.tsv"
+    path.write_text("\n".join(out) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def _load(path):
+    return T.load_txt_to_df(path, usecols_idx=T.COLUMNS_TO_KEEP_IDX, new_names=T.NEW_COLUMN_NAMES)
+
+
+def test_short_and_long_lines_are_kept_and_reported(tmp_path):
+    # riga 31: partenza UA 7100014 senza l'ultimo campo (ATD); riga 40: un campo in più
+    def edit(n, fields):
+        if n == 31:
+            return fields[:-1]
+        if n == 40:
+            return fields + ["EXTRA"]
+        return fields
+    path = _demo_copy(tmp_path, edit)
+
+    df = _load(path)
+    assert len(df) == len(_load(DEMO)) == 150
+    assert [n for n, _ in df.attrs["bad_lines"]] == [31, 40]
+
+    ops, anomalies = T.prepare_df(path, 9)
+    dep = ops[ops["A/D"].eq("D")]
+    assert "7100014" in set(dep["ID"])
+    bad = anomalies.loc[anomalies["CHECK"].eq("BAD_LINE"), "DETAIL"].tolist()
+    assert [d.split(":")[0] for d in bad] == ["riga 31", "riga 40"]
+    assert " | " in bad[0]
+    orphan = anomalies[anomalies["CHECK"].eq("ORPHAN_ARRIVAL")]
+    assert "7100014" not in set(orphan["ID"])
+
+
+def test_default_na_tokens_are_missing_values(tmp_path):
+    # Cod_Ritardo_1 (DLY_1, indice 19) = "NULL" va letto come valore mancante
+    def edit(n, fields):
+        if n == 31:
+            fields[19] = "NULL"
+        return fields
+    path = _demo_copy(tmp_path, edit)
+
+    df = _load(path)
+    assert df.loc[df["ID"].eq("7100014") & df["A/D"].eq("P"), "DLY_1"].isna().all()
+
+    _, anomalies = T.prepare_df(path, 9)
+    unknown = anomalies[anomalies["CHECK"].eq("UNKNOWN_DLY_CODE")]
+    assert not unknown["DETAIL"].str.contains("NULL").any()
@@ -0,0 +1,48 @@
+import pandas as pd
+import CNA_ontime
+
+
+def _flights() -> pd.DataFrame:
+    # due stand, partenze con STD duplicati (stesso stand e stand diversi)
+    std = pd.to_datetime([
+        "2025-09-01 08:00", "2025-09-01 08:00", "2025-09-01 08:30", "2025-09-01 08:30",
+        "2025-09-01 09:00", "2025-09-01 09:10", "2025-09-01 10:05", "2025-09-01 08:00",
+        "2025-09-01 11:30", "2025-09-02 07:00",
+    ])
+    delay = [0, 20, 5, 90, 0, 16, 30, 0, 10, 200]
+    n = len(std)
+    return pd.DataFrame({
+        "ID": [str(i) for i in range(n)],
+        "A/D": ["D"] * n,
+        "IATA": ["DL"] * n,
+        "FLT_N": ["0001"] * n,
+        "STAND": ["601", "601", "601", "703", "601", "703", "601", "703", "703", "601"],
+        "STD": std,
+        "ATD": std + pd.to_timedelta(delay, unit="min"),
+        "DLY_1": ["", "33", "", "93", "", "15", "", "", "", "12"],
+        "DLY_1_t": ["0", "20", "0", "90", "0", "16", "0", "0", "0", "200"],
+        "DLY_2": [""] * n,
+        "DLY_2_t": ["0"] * n,
+    }).sample(frac=1, random_state=0).reset_index(drop=True)
+
+
+def test_rolling_counts_match_manual_window_with_duplicate_std():
+    out = CNA_ontime.rolling_ontime(_flights(), windows=("1h",))
+
+    assert out["N_1h"].notna().all()
+    # finestra (STD - 1h, STD] sulle partenze dello stesso stand che precedono la riga
+    # nell'ordine per STD (a parità di STD contano solo quelle già viste, come in pandas)
+    for i, row in out.iterrows():
+        prev = out.iloc[: i + 1]
+        same = prev[prev["STAND"].eq(row["STAND"])
+                    & prev["STD"].gt(row["STD"] - pd.Timedelta("1h"))
+                    & prev["STD"].le(row["STD"])]
+        assert row["N_1h"] == len(same)
+        ontime = same["DLY_REAL"].fillna(0).le(CNA_ontime.ONTIME_MINUTES).mean() * 100
+        assert row["ONTIME_PCT_1h"] == round(ontime, 1)
+
+
+def test_heatmap_all_rows_cover_every_departure():
+    heat = CNA_ontime.ontime_heatmap(_flights())
+    assert heat.loc[heat["STAND"].eq("ALL"), "N"].sum() == len(_flights())
+    assert heat.loc[heat["STAND"].ne("ALL"), "N"].sum() == len(_flights())
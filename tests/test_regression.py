@@ -0,0 +1,32 @@
+import pandas as pd
+import CNA_regression
+
+
+def _frame() -> pd.DataFrame:
+    return CNA_regression._canonical(pd.DataFrame({
+        "ID": ["1", "2", "3"],
+        "STD": pd.to_datetime(["2025-09-01 08:00", "2025-09-01 09:00", "2025-09-01 10:00"]),
+        "DLY_REAL": [5, None, 200],
+    }))
+
+
+def _diff(old: pd.DataFrame, new: pd.DataFrame) -> dict:
+    return CNA_regression.diff_frames(old, new, CNA_regression.column_hashes(old))
+
+
+def test_same_output_is_unchanged():
+    res = _diff(_frame(), _frame())
+    assert not res["columns"] and not res["reordered"]
+
+
+def test_row_order_change_is_reported_with_unique_ids():
+    old = _frame()
+    res = _diff(old, old.iloc[[1, 0, 2]].reset_index(drop=True))
+    assert not res["columns"]
+    assert res["reordered"]
+
+
+def test_row_order_change_is_reported_without_ids():
+    old = _frame().drop(columns=["ID"])
+    res = _diff(old, old.iloc[[2, 1, 0]].reset_index(drop=True))
+    assert res["reordered"] or res["columns"]
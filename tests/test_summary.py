@@ -0,0 +1,63 @@
+import json
+import numpy as np
+import pandas as pd
+import CNA_summary
+
+
+def _delays(seed: int = 0, n: int = 500) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dly = rng.integers(0, 400, n).astype(float)
+    dly[rng.random(n) < 0.1] = np.nan
+    return pd.DataFrame({
+        "A/D": rng.choice(["D", "A"], n, p=[0.8, 0.2]),
+        "IATA": rng.choice(["DL", "UA"], n),
+        "DLY_REAL": dly,
+        "DLY_1": rng.choice(["", "12", "93"], n),
+        "DLY_1_t": rng.integers(0, 90, n).astype(str),
+        "DLY_2": [""] * n,
+        "DLY_2_t": ["0"] * n,
+        "SURCHARGE": rng.choice(["", "5%", "15%"], n),
+    })
+
+
+def _summary(df: pd.DataFrame) -> CNA_summary.DelaySummary:
+    s = CNA_summary.DelaySummary()
+    s.observe(df, "DLY_REAL")
+    s.observe_codes(df)
+    s.observe_surcharge(df[df["A/D"].eq("D")])
+    return s
+
+
+def test_percentiles_match_numpy_on_integer_minutes():
+    df = _delays()
+    out = _summary(df).to_frame().set_index(["METRIC", "KEY"])
+
+    dep = df[df["A/D"].eq("D")]
+    for carrier, g in dep.groupby("IATA"):
+        v = g["DLY_REAL"].dropna()
+        v = v[v > 0].to_numpy()
+        row = out.loc[("DLY_REAL", carrier)]
+        assert row["N"] == len(g)
+        assert row["N_DLY"] == len(v)
+        for q in CNA_summary.QUANTILES:
+            # nearest-rank = inverted_cdf
+            assert row[f"P{int(q * 100)}"] == np.percentile(v, q * 100, method="inverted_cdf")
+        assert row["MAX"] == v.max()
+        assert row["GE_60"] == (v >= 60).sum()
+
+
+def test_json_round_trip_and_merge_double_the_counts():
+    s = _summary(_delays())
+    once = s.to_frame()
+
+    part = json.loads(json.dumps(s.to_json()))
+    merged = CNA_summary.DelaySummary.from_json(part).merge(CNA_summary.DelaySummary.from_json(part))
+    twice = merged.to_frame()
+
+    pd.testing.assert_frame_equal(CNA_summary.DelaySummary.from_json(part).to_frame(), once)
+    counts = ["N", "N_NA", "N_DLY", "GE_15", "GE_60", "GE_120", "GE_180"]
+    pd.testing.assert_frame_equal(twice[counts], once[counts] * 2)
+    same = ["METRIC", "KEY", "MEAN", "P50", "P90", "P95", "MAX"]
+    pd.testing.assert_frame_equal(twice[same], once[same])
+    assert (once["METRIC"].str.startswith("SURCHARGE_")).any()
+    assert str(once["N_DLY"].dtype) == "Int64"